@@ -44,6 +44,11 @@ class CellEnv(gym.Env):
             # euler angles + cell length
             self.action_space = spaces.Box(
                 low=-1., high=1., shape=(4*self.dim, ), dtype=np.float32)
+            # cell length = action * scale + shift, mapping [-1, 1] onto the
+            # cell bounds (fixed by the particle shapes, so computed once)
+            lbound, ubound = self.packing.cell_bound
+            self.length_scale = (ubound - lbound) / 2.
+            self.length_shift = (ubound + lbound) / 2.
 
         # observation space
         self.build_observation_space()
@@ -80,7 +85,7 @@ class CellEnv(gym.Env):
             # 1st vector: along the x axis
             # 2nd vector: in the positive part of the xy-plane
             # 3rd vector: in the z > 0 half space
-            variable = np.random.rand(6)
+            variable = self.np_random.uniform(size=6)
 
             lattice = np.zeros((3, 3))
             id = -1
@@ -125,10 +130,11 @@ class CellEnv(gym.Env):
                 particle_info.append(np.concatenate(
                     [scaled_pos] + [np.asarray([particle.radius])]))
 
-        # cell basis
-        cell_info = (self.agent.state.lattice).tolist()
+        # cell basis (row views, no round trip through Python floats)
+        cell_info = list(self.agent.state.lattice)
 
-        obs = np.concatenate(particle_info + cell_info)
+        # match the float32 observation_space so the policy can consume it without a copy
+        obs = np.concatenate(particle_info + cell_info).astype(np.float32)
 
         return obs
 
@@ -228,5 +234,4 @@ class CellEnv(gym.Env):
 
             self.agent.action.angle = action[:, 0:3] * np.pi
             self.agent.action.angle[:, 1] /= 2.
-            self.agent.action.length = data_scale(
-                action[:, 3], from_range=(-1, 1), to_range=self.packing.cell_bound)
+            self.agent.action.length = action[:, 3] * self.length_scale + self.length_shift
@@ -1,7 +1,7 @@
 import numpy as np
 
 import math
-from copy import deepcopy
+from copy import copy
 from myutils import *
 
 class Particle(object):
@@ -29,8 +29,12 @@ class Particle(object):
         """
         Translate the target particle by the vector.
         """
-        image = deepcopy(self)
-        image.state.centroid += vector
+        # only the centroid differs, so copy the particle shallowly and
+        # give the image its own state rather than deep-copying everything
+        image = copy(self)
+        image.state = ParticleState()
+        image.state.centroid = self.state.centroid + vector
+        image.state.orientation = self.state.orientation
         return image
     
     def periodic_check(self, lattice):
@@ -8,6 +8,9 @@ from torch.distributions.normal import Normal
 from torch.distributions.categorical import Categorical
 
 
+LOG_SQRT_2PI = 0.5 * np.log(2 * np.pi)
+
+
 def combined_shape(length, shape=None):
     if shape is None:
         return (length,)
@@ -38,6 +41,8 @@ def discount_cumsum(x, discount):
         [x0 + discount * x1 + discount^2 * x2,  
          x1 + discount * x2,
          x2]
+    the reverse recurrence runs as a compiled IIR filter along axis 0, so
+    x may also be 2-D with one independent stream per column.
     """
     return scipy.signal.lfilter([1], [1, float(-discount)], x[::-1], axis=0)[::-1]
 
@@ -60,6 +65,13 @@ class Actor(nn.Module):
             logp_a = self._log_prob_from_distribution(pi, act)
         return pi, logp_a
 
+    def _sample(self, obs):
+        # Sample actions for given observations together with their
+        # log likelihood under the current policy.
+        pi = self._distribution(obs)
+        a = pi.sample()
+        return a, self._log_prob_from_distribution(pi, a)
+
 
 class MLPCategoricalActor(Actor):
     
@@ -86,10 +98,21 @@ class MLPGaussianActor(Actor):
     def _distribution(self, obs):
         mu = self.mu_net(obs)
         std = torch.exp(self.log_std)
-        return Normal(mu, std)
+        # mu and std are finite by construction, skip the per-call argument checks
+        return Normal(mu, std, validate_args=False)
 
     def _log_prob_from_distribution(self, pi, act):
-        return pi.log_prob(act).sum(axis=-1)    # Last axis sum needed for Torch Normal distribution
+        # closed-form Gaussian log-density, reusing log_std instead of log(scale)
+        z = (act - pi.loc) / pi.scale
+        return (-0.5 * z**2 - self.log_std - LOG_SQRT_2PI).sum(axis=-1)    # Last axis sum over action dims
+
+    def _sample(self, obs):
+        # a = mu + std * eps, so eps already is the standardized z of the log-density
+        mu = self.mu_net(obs)
+        eps = torch.randn_like(mu)
+        a = mu + torch.exp(self.log_std) * eps
+        logp_a = (-0.5 * eps**2 - self.log_std - LOG_SQRT_2PI).sum(axis=-1)
+        return a, logp_a
 
 
 class MLPCritic(nn.Module):
@@ -123,13 +146,20 @@ class MLPActorCritic(nn.Module):
         self.vc = MLPCritic(obs_dim, hidden_sizes, activation)
 
     def step(self, obs):
-        with torch.no_grad():
-            pi = self.pi._distribution(obs)
-            a = pi.sample()
-            logp_a = self.pi._log_prob_from_distribution(pi, a)
+        # inference_mode skips the view/version-counter bookkeeping that
+        # no_grad still does, which matters for one forward per env step
+        with torch.inference_mode():
+            a, logp_a = self.pi._sample(obs)
             v = self.v(obs)
             vc = self.vc(obs)
         return a.numpy(), v.numpy(), vc.numpy(), logp_a.numpy()
 
+    def value(self, obs):
+        # critics only, for bootstrapping a cut-off path
+        with torch.inference_mode():
+            v = self.v(obs)
+            vc = self.vc(obs)
+        return v.numpy(), vc.numpy()
+
     def act(self, obs):
         return self.step(obs)[0]
\ No newline at end of file
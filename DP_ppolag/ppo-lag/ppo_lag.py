@@ -8,7 +8,6 @@ from utils.logx import EpochLogger
 from utils.mpi_pytorch import setup_pytorch_for_mpi, sync_params, mpi_avg_grads
 from utils.mpi_tools import mpi_avg, proc_id, mpi_statistics_scalar, num_procs
 from torch.nn.functional import softplus
-torch.autograd.set_detect_anomaly(True)
 
 
 class PPOBuffer:
@@ -25,15 +24,14 @@ class PPOBuffer:
         self.adv_buf = np.zeros(size, dtype=np.float32)
         self.cadv_buf = np.zeros(size, dtype=np.float32)
 
-        self.rew_buf = np.zeros(size, dtype=np.float32)
-        self.crew_buf = np.zeros(size, dtype=np.float32)
+        # (reward, cost) and (value, cost value) are stored as column pairs,
+        # plus one spare row that finish_path uses for the bootstrap values
+        self.rew_buf = np.zeros((size + 1, 2), dtype=np.float32)
+        self.val_buf = np.zeros((size + 1, 2), dtype=np.float32)
 
         self.ret_buf = np.zeros(size, dtype=np.float32)
         self.cret_buf = np.zeros(size, dtype=np.float32)
 
-        self.val_buf = np.zeros(size, dtype=np.float32)
-        self.cval_buf = np.zeros(size, dtype=np.float32)
-        
         self.logp_buf = np.zeros(size, dtype=np.float32)
         self.gamma, self.lam = gamma, lam
         self.ptr, self.path_start_idx, self.max_size = 0, 0, size
@@ -46,11 +44,8 @@ class PPOBuffer:
         assert self.ptr < self.max_size     # buffer has to have room so you can store
         self.obs_buf[self.ptr] = obs
         self.act_buf[self.ptr] = act
-        self.rew_buf[self.ptr] = rew
-        self.crew_buf[self.ptr] = crew
-
-        self.val_buf[self.ptr] = val
-        self.cval_buf[self.ptr] = cval
+        self.rew_buf[self.ptr] = rew, crew
+        self.val_buf[self.ptr] = val, cval
 
         self.logp_buf[self.ptr] = logp
         self.ptr += 1
@@ -71,23 +66,20 @@ class PPOBuffer:
         """
 
         path_slice = slice(self.path_start_idx, self.ptr)
-        rews = np.append(self.rew_buf[path_slice], last_val)
-        crews = np.append(self.crew_buf[path_slice], last_cval)
+        # bootstrap row right after the path; the next store() overwrites it
+        self.rew_buf[self.ptr] = last_val, last_cval
+        self.val_buf[self.ptr] = last_val, last_cval
+        rews = self.rew_buf[self.path_start_idx:self.ptr+1]
+        vals = self.val_buf[self.path_start_idx:self.ptr+1]
 
-        vals = np.append(self.val_buf[path_slice], last_val)
-        cvals = np.append(self.cval_buf[path_slice], last_cval)
-        
         # the next two lines implement GAE-Lambda advantage calculation
         deltas = rews[:-1] + self.gamma * vals[1:] - vals[:-1]
-        cdeltas = crews[:-1] + self.gamma * cvals[1:] - cvals[:-1]
+        advs = core.discount_cumsum(deltas, self.gamma * self.lam)
+        self.adv_buf[path_slice], self.cadv_buf[path_slice] = advs[:, 0], advs[:, 1]
 
-        self.adv_buf[path_slice] = core.discount_cumsum(deltas, self.gamma * self.lam)
-        self.cadv_buf[path_slice] = core.discount_cumsum(cdeltas, self.gamma * self.lam)
-
-        
-        # the next line computes rewards-to-go, to be targets for the value function
-        self.ret_buf[path_slice] = core.discount_cumsum(rews, self.gamma)[:-1]
-        self.cret_buf[path_slice] = core.discount_cumsum(crews, self.gamma)[:-1]
+        # the next lines compute rewards-to-go, to be targets for the value function
+        rets = core.discount_cumsum(rews, self.gamma)[:-1]
+        self.ret_buf[path_slice], self.cret_buf[path_slice] = rets[:, 0], rets[:, 1]
         
         self.path_start_idx = self.ptr
 
@@ -103,8 +95,10 @@ class PPOBuffer:
         adv_mean, adv_std = mpi_statistics_scalar(self.adv_buf)
         cadv_mean, cadv_std = mpi_statistics_scalar(self.cadv_buf)
 
-        self.adv_buf = (self.adv_buf - adv_mean) / adv_std
-        self.cadv_buf = (self.cadv_buf - cadv_mean) #/ adv_std
+        # normalize in place, so torch.as_tensor below wraps the buffers without new allocations
+        self.adv_buf -= adv_mean
+        self.adv_buf /= adv_std
+        self.cadv_buf -= cadv_mean #/ adv_std
 
         data = dict(obs=self.obs_buf, act=self.act_buf, ret=self.ret_buf, cret=self.cret_buf,
                     adv=self.adv_buf, cadv=self.cadv_buf, logp=self.logp_buf)
@@ -164,7 +158,10 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
             you provided to PPO.
         seed (int): Seed for random number generators.
         steps_per_epoch (int): Number of steps of interaction (state-action pairs) 
-            for the agent and the environment in each epoch.
+            for the agent and the environment in each epoch. Split evenly
+            across MPI processes, each stepping its own copy of the
+            environment, so rollouts run in parallel when launched with
+            several processes (``--cpu`` in runner.py).
         epochs (int): Number of epochs of interaction (equivalent to
             number of policy updates) to perform.
         gamma (float): Discount factor. (Always between 0 and 1.)
@@ -206,6 +203,7 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
 
     # Instantiate environment
     env = env_fn()
+    env.seed(seed)
     obs_dim = env.observation_space.shape
     act_dim = env.action_space.shape
 
@@ -227,23 +225,21 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
     def compute_loss_pi(data):
         obs, act, adv, cadv,  logp_old = data['obs'], data['act'], data['adv'], data['cadv'] ,data['logp']
         cur_cost = data['cur_cost']
-        penalty_param = data['cur_penalty']
+        penalty_item = data['cur_penalty']
         cost_limit = 0.1
         # Policy loss
         pi, logp = ac.pi(obs, act)
         ratio = torch.exp(logp - logp_old)
 
-        clip_adv = torch.clamp(ratio, 1-clip_ratio, 1+clip_ratio) * adv
-        loss_rpi = (torch.min(ratio * adv, clip_adv)).mean()
+        # min(ratio*adv, clip(ratio)*adv) only ever clips on the side given by sign(adv)
+        clipped_ratio = torch.where(adv >= 0, ratio.clamp(max=1+clip_ratio), ratio.clamp(min=1-clip_ratio))
+        loss_rpi = (clipped_ratio * adv).mean()
 
         # clip_cadv = torch.clamp(ratio, 1-clip_ratio, 1+clip_ratio) * cadv
         # loss_cpi = (torch.min(ratio * cadv, clip_cadv)).mean()
         loss_cpi = ratio*cadv
         loss_cpi = loss_cpi.mean()
-        
-        p = softplus(penalty_param)
-        penalty_item = p.item()
-      
+
         pi_objective = loss_rpi - penalty_item*loss_cpi
         pi_objective = pi_objective/(1+penalty_item)
         loss_pi = -pi_objective
@@ -251,11 +247,12 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
 
         cost_deviation = (cur_cost - cost_limit)
 
-        # Useful extra info
-        approx_kl = (logp_old - logp).mean().item()
-        ent = pi.entropy().mean().item()
-        clipped = ratio.gt(1+clip_ratio) | ratio.lt(1-clip_ratio)
-        clipfrac = torch.as_tensor(clipped, dtype=torch.float32).mean().item()
+        # Useful extra info (kept out of the autograd graph)
+        with torch.no_grad():
+            approx_kl = (logp_old - logp).mean().item()
+            ent = pi.entropy().mean().item()
+            clipped = ratio.gt(1+clip_ratio) | ratio.lt(1-clip_ratio)
+            clipfrac = torch.as_tensor(clipped, dtype=torch.float32).mean().item()
         pi_info = dict(kl=approx_kl, ent=ent, cf=clipfrac)
 
         return loss_pi, cost_deviation, pi_info
@@ -266,9 +263,15 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
         return ((ac.v(obs) - ret)**2).mean(),((ac.vc(obs) - cret)**2).mean()
 
 
+    # Parameter lists are fixed for the whole run, so collect them once
+    # for the optimizers and the per-step gradient averaging
+    pi_params = list(ac.pi.parameters())
+    v_params = list(ac.v.parameters())
+    vc_params = list(ac.vc.parameters())
+
     # Set up optimizers for policy and value function
     pi_lr = 3e-4
-    pi_optimizer = Adam(ac.pi.parameters(), lr=pi_lr)
+    pi_optimizer = Adam(pi_params, lr=pi_lr)
     penalty_param = torch.tensor(1.0,requires_grad=True).float()
     penalty = softplus(penalty_param)
     
@@ -276,8 +279,8 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
     penalty_lr = 5e-2
     penalty_optimizer = Adam([penalty_param], lr=penalty_lr)
     vf_lr = 1e-3
-    vf_optimizer = Adam(ac.v.parameters(), lr=vf_lr)
-    cvf_optimizer = Adam(ac.vc.parameters(),lr=vf_lr)
+    vf_optimizer = Adam(v_params, lr=vf_lr)
+    cvf_optimizer = Adam(vc_params, lr=vf_lr)
     # Set up model saving
     logger.setup_pytorch_saver(ac)
 
@@ -287,21 +290,21 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
         cur_cost = logger.get_stats('EpCost')[0]
         data = buf.get()
         data['cur_cost'] = cur_cost
-        data['cur_penalty'] = penalty_param
+        # the penalty is fixed for all policy iterations of this update,
+        # so resolve softplus(penalty_param) once instead of per loss call
+        data['cur_penalty'] = softplus(penalty_param).item()
         pi_l_old, cost_dev, pi_info_old = compute_loss_pi(data)
         #print(penalty_param)
         loss_penalty = -penalty_param*cost_dev
 
         
-        penalty_optimizer.zero_grad()
+        penalty_optimizer.zero_grad(set_to_none=True)
         loss_penalty.backward()
-        mpi_avg_grads(penalty_param)
+        mpi_avg_grads([penalty_param])
         penalty_optimizer.step()
         #print(penalty_param)
 
-        #penalty = softplus(penalty_param)
-
-        data['cur_penalty'] = penalty_param
+        data['cur_penalty'] = softplus(penalty_param).item()
 
         pi_l_old = pi_l_old.item()
         v_l_old, cv_l_old = compute_loss_v(data)
@@ -311,7 +314,7 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
         # Train policy with multiple steps of gradient descent
         train_pi_iters=80
         for i in range(train_pi_iters):
-            pi_optimizer.zero_grad()
+            pi_optimizer.zero_grad(set_to_none=True)
             loss_pi, _,pi_info = compute_loss_pi(data)
             kl = mpi_avg(pi_info['kl'])
             if kl > 1.2 * target_kl:
@@ -319,7 +322,7 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
                 break
 
             loss_pi.backward()
-            mpi_avg_grads(ac.pi)    # average grads across MPI processes
+            mpi_avg_grads(pi_params)    # average grads across MPI processes
             pi_optimizer.step()
 
         logger.store(StopIter=i)
@@ -329,14 +332,13 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
         for i in range(train_v_iters):
             
             loss_v, loss_vc = compute_loss_v(data)
-            vf_optimizer.zero_grad()
-            loss_v.backward()
-            mpi_avg_grads(ac.v)   # average grads across MPI processes
+            vf_optimizer.zero_grad(set_to_none=True)
+            cvf_optimizer.zero_grad(set_to_none=True)
+            # v and vc share no parameters, so a single backward pass fills both
+            (loss_v + loss_vc).backward()
+            mpi_avg_grads(v_params)   # average grads across MPI processes
+            mpi_avg_grads(vc_params)
             vf_optimizer.step()
-
-            cvf_optimizer.zero_grad()
-            loss_vc.backward()
-            mpi_avg_grads(ac.vc)
             cvf_optimizer.step()
 
         # Log changes from update
@@ -362,11 +364,9 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
             ep_cret += c
             ep_len += 1
 
-            # save and log
+            # save
             buf.store(o, a, r, c, v,vc, logp)
-            logger.store(VVals=v)
-            logger.store(CVVals=vc)
-            
+
             # Update obs (critical!)
             o = next_o
 
@@ -379,7 +379,7 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
                     print('Warning: trajectory cut off by epoch at %d steps.'%ep_len, flush=True)
                 # if trajectory didn't reach terminal state, bootstrap value target
                 if timeout or epoch_ended:
-                    _, v,vc, _ = ac.step(torch.as_tensor(o, dtype=torch.float32))
+                    v, vc = ac.value(torch.as_tensor(o, dtype=torch.float32))
                 else:
                     v = 0
                     vc = 0
@@ -389,6 +389,9 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
                     logger.store(EpRet=ep_ret, EpLen=ep_len, EpCost=ep_cret)
                 o, ep_ret, ep_cret, ep_len = env.reset(), 0, 0, 0
 
+        # log value estimates once per epoch, straight from the buffer
+        # (the last row is finish_path's bootstrap slot)
+        logger.store(VVals=buf.val_buf[:-1, 0].copy(), CVVals=buf.val_buf[:-1, 1].copy())
 
         # Save model
         if (epoch % save_freq == 0) or (epoch == epochs-1):
@@ -403,6 +406,7 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
         logger.log_tabular('EpCost',with_min_and_max=True)
         logger.log_tabular('EpLen', average_only=True)
         logger.log_tabular('VVals', with_min_and_max=True)
+        logger.log_tabular('CVVals', with_min_and_max=True)
         logger.log_tabular('TotalEnvInteracts', (epoch+1)*steps_per_epoch)
         logger.log_tabular('LossPi', average_only=True)
         logger.log_tabular('LossV', average_only=True)
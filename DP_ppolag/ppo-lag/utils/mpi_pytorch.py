@@ -17,21 +17,22 @@ def setup_pytorch_for_mpi():
     torch.set_num_threads(fair_num_threads)
     #print('Proc %d: Reporting new number of Torch threads as %d.'%(proc_id(), torch.get_num_threads()), flush=True)
 
-def mpi_avg_grads(module):
-    """ Average contents of gradient buffers across MPI processes. """
+def mpi_avg_grads(params):
+    """
+    Average contents of gradient buffers across MPI processes.
+
+    Accepts a module or an iterable of parameters, e.g. a list cached
+    once at setup instead of walking module.parameters() every step.
+    """
     if num_procs()==1:
         return
-    try:
-        for p in module.parameters():
-            p_grad_numpy = p.grad.numpy()   # numpy view of tensor data
-            avg_p_grad = mpi_avg(p.grad)
-            p_grad_numpy[:] = avg_p_grad[:]
-    except:
-        p = module  
+    if isinstance(params, torch.nn.Module):
+        params = params.parameters()
+    for p in params:
         p_grad_numpy = p.grad.numpy()   # numpy view of tensor data
         avg_p_grad = mpi_avg(p.grad)
-        p_grad_numpy = avg_p_grad
-        
+        p_grad_numpy[...] = avg_p_grad  # [...] also writes back 0-d grads
+
 
 
 def sync_params(module):
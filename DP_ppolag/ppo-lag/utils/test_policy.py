@@ -98,11 +98,28 @@ def load_pytorch_policy(fpath, itr, deterministic=False):
     model = torch.load(fname)
 
     # make function for producing an action given a single state
-    def get_action(x):
-        with torch.no_grad():
-            x = torch.as_tensor(x, dtype=torch.float32)
-            action = model.act(x)
-        return action
+    if deterministic and hasattr(model.pi, 'mu_net'):
+        # Gaussian policies act with their mean: trace the mean network once
+        # on the first observation and run the frozen TorchScript graph after
+        print('Using deterministic action op.')
+        mu_net = None
+
+        def get_action(x):
+            nonlocal mu_net
+            with torch.no_grad():
+                x = torch.as_tensor(x, dtype=torch.float32)
+                if mu_net is None:
+                    mu_net = torch.jit.freeze(torch.jit.trace(model.pi.mu_net.eval(), x))
+                action = mu_net(x).numpy()
+            return action
+    else:
+        print('Using default action op.')
+
+        def get_action(x):
+            with torch.no_grad():
+                x = torch.as_tensor(x, dtype=torch.float32)
+                action = model.act(x)
+            return action
 
     return get_action
 